@@ -2,27 +2,63 @@
 This module is responsbile for building modulefiles in a structured way.
 """
 import os
+import io
+import sys
+import re
+import copy
 import json
-# pylint: disable=W0401,W0614
-from jarvis_util import *
-# pylint: enable=W0401,W0614
-from scspkg.scspkg_manager import ScspkgManager, ModuleType
+import yaml
+from scspkg.scspkg_manager import ScspkgManager, ModuleType, SchemaFormat, \
+    YAML_LOADER, YAML_DUMPER
+from scspkg.tcl_writer import render_tcl
 from abc import ABC, abstractmethod
 
+# Parsed schemas keyed by path -> (st_mtime_ns, st_size, sections)
+_SCHEMA_CACHE = {}
+
+_MGR = None
+
+
+def _mgr():
+    """
+    Get the ScspkgManager singleton, binding it on first use
+
+    :return: ScspkgManager
+    """
+    global _MGR  # pylint: disable=W0603
+    if _MGR is None:
+        _MGR = ScspkgManager.get_instance()
+    return _MGR
+
 
 class Package:
     """
     Package represents a modulefile and the source code for a pacakge.
     """
 
+    # The default prepend paths, relative to pkg_root
+    _PREPEND_SUFFIXES = {
+        'PATH': ('bin', 'sbin'),
+        'LD_LIBRARY_PATH': ('lib', 'lib64'),
+        'LIBRARY_PATH': ('lib', 'lib64'),
+        # 'INCLUDE': ('include',),
+        # 'CPATH': ('include',),
+        'INCLUDE': (),
+        'CPATH': (),
+        'CMAKE_PREFIX_PATH': ('cmake',),
+        'PYTHONPATH': ('bin', 'lib', 'lib64'),
+        'PKG_CONFIG_PATH': ('lib/pkgconfig', 'lib64/pkgconfig'),
+        'CFLAGS': (),
+        'LDFLAGS': ()
+    }
+
     def __init__(self, package_name):
-        self.scspkg = ScspkgManager.get_instance()
+        self.scspkg = _mgr()
         self.name = package_name
         self.pkg_root = os.path.join(self.scspkg.pkg_dir, package_name)
         self.pkg_src = os.path.join(self.pkg_root, 'src')
         self.module_path = os.path.join(self.scspkg.module_dir, self.name)
-        self.module_schema_path = os.path.join(self.pkg_root,
-                                               f'{self.name}.yaml')
+        self.module_schema_path = self._schema_paths()[0]
         self.mod_load_name = f'SCSPKG_{self.name}_LOADED'
         self.sections = {}
         self.reset_config()
@@ -40,28 +76,19 @@ class Package:
             'Version': 'None',
             'doc': 'None'
         }
-        self.sections['deps'] = {}
+        self.sections['deps'] = []
         self.sections['setenvs'] = {}
-        self.sections['prepends'] = {
-            'PATH': [os.path.join(self.pkg_root, 'bin'),
-                     os.path.join(self.pkg_root, 'sbin')],
-            'LD_LIBRARY_PATH': [os.path.join(self.pkg_root, 'lib'),
-                                os.path.join(self.pkg_root, 'lib64')],
-            'LIBRARY_PATH': [os.path.join(self.pkg_root, 'lib'),
-                             os.path.join(self.pkg_root, 'lib64')],
-            # 'INCLUDE': [os.path.join(self.pkg_root, 'include')],
-            # 'CPATH': [os.path.join(self.pkg_root, 'include')],
-            'INCLUDE': [],
-            'CPATH': [],
-            'CMAKE_PREFIX_PATH': [os.path.join(self.pkg_root, 'cmake')],
-            'PYTHONPATH': [os.path.join(self.pkg_root, 'bin'),
-                           os.path.join(self.pkg_root, 'lib'),
-                           os.path.join(self.pkg_root, 'lib64')],
-            'PKG_CONFIG_PATH': [os.path.join(self.pkg_root, 'lib', 'pkgconfig'),
-                                os.path.join(self.pkg_root, 'lib64', 'pkgconfig')],
-            'CFLAGS': [],
-            'LDFLAGS': []
-        }
+        self.sections['appends'] = {}
+        if os.sep == '/':
+            root = f'{self.pkg_root}/'
+            self.sections['prepends'] = {
+                env: [root + suffix for suffix in suffixes]
+                for env, suffixes in self._PREPEND_SUFFIXES.items()}
+        else:
+            self.sections['prepends'] = {
+                env: [os.path.join(self.pkg_root, *suffix.split('/'))
+                      for suffix in suffixes]
+                for env, suffixes in self._PREPEND_SUFFIXES.items()}
         return self
 
     def create(self):
@@ -71,26 +98,98 @@ class Package:
         :return: self
         """
         os.makedirs(self.pkg_root, exist_ok=True)
-        os.makedirs(self.pkg_src, exist_ok=True)
-        os.makedirs(f'{self.pkg_root}/include', exist_ok=True)
-        os.makedirs(f'{self.pkg_root}/lib', exist_ok=True)
-        os.makedirs(f'{self.pkg_root}/lib64', exist_ok=True)
+        # pkg_root exists now, so only one mkdir is needed per subdirectory
+        for subdir in (self.pkg_src, f'{self.pkg_root}/include',
+                       f'{self.pkg_root}/lib', f'{self.pkg_root}/lib64'):
+            try:
+                os.mkdir(subdir)
+            except FileExistsError:
+                pass
         self.save()
         return self
 
     def load(self):
         """
-        Load the YAML config from the package root
-        """
-        if os.path.exists(self.module_schema_path):
-            self.sections = YamlFile(self.module_schema_path).load()
+        Load the schema from the package root
+        """
+        for path in self._schema_paths():
+            try:
+                fp = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            self.module_schema_path = path
+            with fp:
+                st = os.fstat(fp.fileno())
+                cached = _SCHEMA_CACHE.get(path)
+                if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+                    self.sections = copy.deepcopy(cached[2])
+                    return self
+                data = fp.read()
+            if not data.strip():
+                sections = None
+            elif path.endswith('.json'):
+                sections = json.loads(data)
+            else:
+                sections = yaml.load(data, Loader=YAML_LOADER)
+            # An empty schema keeps the skeleton configuration
+            if sections:
+                self.sections = sections
+            else:
+                self.reset_config()
+            # Older schemas stored deps as {dep: True}
+            if isinstance(self.sections.get('deps'), dict):
+                self.sections['deps'] = list(self.sections['deps'])
+            self._cache_schema(st)
+            return self
         return self
 
+    def _schema_paths(self):
+        """
+        The candidate schema paths, the configured schema format first
+
+        :return: List of paths
+        """
+        formats = [SchemaFormat.YAML, SchemaFormat.JSON]
+        if self.scspkg.schema_format == SchemaFormat.JSON:
+            formats.reverse()
+        return [os.path.join(self.pkg_root, f'{self.name}.{fmt.value}')
+                for fmt in formats]
+
+    def _cache_schema(self, st=None):
+        """
+        Remember the parsed schema so later loads can skip the parse
+
+        :param st: The os.stat result of the schema file
+        :return: None
+        """
+        if st is None:
+            st = os.stat(self.module_schema_path)
+        _SCHEMA_CACHE[self.module_schema_path] = (
+            st.st_mtime_ns, st.st_size, copy.deepcopy(self.sections))
+
     def save(self):
         """
-        Save the YAML + modulefiles to the directories.
+        Save the schema + modulefiles to the directories.
         """
-        YamlFile(self.module_schema_path).save(self.sections)
+        path = self._schema_paths()[0]
+        if self.scspkg.schema_format == SchemaFormat.JSON:
+            data = json.dumps(self.sections, separators=(',', ':'))
+            with open(path, 'wb', buffering=0) as fp:
+                fp.write(data.encode('utf-8'))
+        else:
+            # Let the emitter stream straight into a large write buffer
+            with open(path, 'wb', buffering=1 << 17) as fp:
+                yaml.dump(self.sections, fp, Dumper=YAML_DUMPER,
+                          default_flow_style=False, encoding='utf-8')
+        # Drop the schema saved in the other format
+        if path != self.module_schema_path:
+            try:
+                os.remove(self.module_schema_path)
+            except FileNotFoundError:
+                pass
+            _SCHEMA_CACHE.pop(self.module_schema_path, None)
+            self.module_schema_path = path
+        self._cache_schema()
         if self.scspkg.module_type == ModuleType.TCL:
             self._save_as_tcl()
         elif self.scspkg.module_type == ModuleType.BASH:
@@ -103,26 +202,7 @@ class Package:
 
         :return: None
         """
-        module = []
-        # The module header
-        module.append('#%Module1.0')
-        # The module doc
-        for doc_key, doc_val in self.sections['doc'].items():
-            module.append(f'module-whatis \'{doc_key}: {doc_val}\'')
-        # The module dependencies
-        for dep in self.sections['deps'].keys():
-            module.append(f'module load {dep}')
-        # The module environment variables
-        for env, env_data in self.sections['setenvs'].items():
-            module.append(f'setenv {env} {env_data}')
-        # The module environment prepends
-        for env, values in self.sections['prepends'].items():
-            for env_data in values:
-                module.append(f'prepend-path {env} {env_data}')
-        # Write the lines
-        with open(self.module_path, 'w', encoding='utf-8') as fp:
-            module = '\n'.join(module)
-            fp.write(module)
+        self._write_module(render_tcl(self.sections))
 
     def _save_as_bash(self):
         """
@@ -130,21 +210,30 @@ class Package:
 
         :return: None
         """
-        module = []
+        buf = io.StringIO()
+        w = buf.write
         # The module header
-        module.append('#!/bin/bash')
+        w('#!/bin/bash\n')
         # The module doc
         for doc_key, doc_val in self.sections['doc'].items():
-            module.append(f'# \"{doc_key}: {doc_val}\"')
+            w(f'# \"{doc_key}: {doc_val}\"\n')
         # The module dependencies
-        for dep in self.sections['deps'].keys():
-            module.append(f'$(scspkg module load {dep})')
+        for dep in self.sections['deps']:
+            w(f'$(scspkg module load {dep})\n')
         # The module environment variables
-        module.append('$(scspkg module load )')
+        w('$(scspkg module load )\n')
         # Write the lines
-        with open(self.module_path, 'w', encoding='utf-8') as fp:
-            module = '\n'.join(module)
-            fp.write(module)
+        self._write_module(buf.getvalue())
+
+    def _write_module(self, module):
+        """
+        Write the modulefile text using a single unbuffered write
+
+        :param module: The text of the modulefile
+        :return: None
+        """
+        with open(self.module_path, 'wb', buffering=0) as fp:
+            fp.write(module.encode('utf-8'))
 
     def destroy(self):
         """
@@ -152,8 +241,12 @@ class Package:
 
         :return: self
         """
+        # pylint: disable=C0415
+        from jarvis_util import Rm
+        # pylint: enable=C0415
         Rm(self.pkg_root)
         Rm(self.module_path)
+        _SCHEMA_CACHE.pop(self.module_schema_path, None)
         return self
 
     def set_env(self, env_name, env_data):
@@ -165,8 +258,7 @@ class Package:
         :return: self
         """
         self.sections['setenvs'][env_name] = env_data
-        if env_name in self.sections['prepends']:
-            del self.sections['prepends'][env_name]
+        self.sections['prepends'].pop(env_name, None)
         return self
 
     def prepend_env(self, env_name, env_data):
@@ -194,10 +286,8 @@ class Package:
         """
         if isinstance(env_data, str):
             env_data = [env_data]
-        if env_name not in self.sections['appends']:
-            self.sections['appends'][env_name] = []
-        env_data += self.sections['appends'][env_name]
-        self.sections['appends'][env_name] = env_data
+        appends = self.sections.setdefault('appends', {})
+        appends.setdefault(env_name, []).extend(env_data)
         return self
 
     def rm_env(self, env_name):
@@ -207,10 +297,8 @@ class Package:
         :param env_name: The environment variable to remove
         :return: self
         """
-        if env_name in self.sections['setenvs']:
-            del self.sections['setenvs'][env_name]
-        if env_name in self.sections['prepends']:
-            del self.sections['prepends'][env_name]
+        self.sections['setenvs'].pop(env_name, None)
+        self.sections['prepends'].pop(env_name, None)
         return self
 
     def pop_prepend(self, env_name, env_data):
@@ -221,14 +309,14 @@ class Package:
         :param env_data: The entry to remove
         :return: self
         """
-        if env_name in self.sections['prepends']:
-            prepends = self.sections['prepends'][env_name]
-            if env_data in prepends:
-                prepends.remove(env_data)
-            else:
-                print(f'{env_data} not in {env_name} prepend variable')
-        else:
+        prepends = self.sections['prepends'].get(env_name)
+        if prepends is None:
             print(f'{env_name} is not a prepend variable')
+            return self
+        try:
+            prepends.remove(env_data)
+        except ValueError:
+            print(f'{env_data} not in {env_name} prepend variable')
         return self
 
     def build_profile(self, path=None, rebuild=False):
@@ -253,8 +341,12 @@ class Package:
         """
         if isinstance(deps, str):
             deps = [deps]
+        cur = self.sections['deps']
+        known = set(cur)
         for dep in deps:
-            self.sections['deps'][dep] = True
+            if dep not in known:
+                known.add(dep)
+                cur.append(dep)
         return self
 
     def pop_deps(self, deps):
@@ -266,9 +358,9 @@ class Package:
         """
         if isinstance(deps, str):
             deps = [deps]
-        for dep in deps:
-            if dep in self.sections['deps']:
-                del self.sections['deps'][dep]
+        deps = set(deps)
+        self.sections['deps'] = [dep for dep in self.sections['deps']
+                                 if dep not in deps]
         self.save()
         return self
 
@@ -276,7 +368,7 @@ class Package:
         """
         Print all dependencies of the module
         """
-        for dep in self.sections['deps'].keys():
+        for dep in self.sections['deps']:
             print(dep)
 
     def get_module_schema(self):
@@ -341,7 +433,7 @@ class ScriptLoader(ABC):
 
     def __init__(self, pkg):
         self.pkg = pkg
-        self.scspkg = ScspkgManager.get_instance()
+        self.scspkg = _mgr()
         self.name = self.pkg.name
         self.mod_load_name = self.pkg.mod_load_name
         self.sections = self.pkg.sections
@@ -376,7 +468,7 @@ class ScriptLoader(ABC):
         for env, values in self.sections['prepends'].items():
             if values:
                 envs.append(self.prepend_env(env, values))
-        
+
         # Mark this module as loaded
         envs.append(self.set_env(self.mod_load_name, '1'))
         return '\n'.join(envs)
@@ -400,10 +492,14 @@ class ScriptLoader(ABC):
         # Process prepends
         for env, values in self.sections['prepends'].items():
             if values:
+                val = os.environ.get(env)
+                if val is None:
+                    continue
                 path_str = ':'.join(values)
-                if env in os.environ:
-                    os.environ[env] = os.environ[env].replace(path_str, '').strip(':')
-                    envs.append(self.set_env(env, os.environ[env]))
+                pat = re.compile('(^|:)' + re.escape(path_str) + '(?=:|$)')
+                new_val = pat.sub('', val).lstrip(':')
+                os.environ[env] = new_val
+                envs.append(self.set_env(env, new_val))
 
         # Mark this module as unloaded
         self.unset_env(self.mod_load_name)
@@ -463,11 +559,10 @@ class BashLoader(ScriptLoader):
         :return: None
         """
         path_str = ':'.join(values)
-        env_val = os.environ[env_name]
-        if env_name in os.environ:
+        env_val = os.environ.get(env_name)
+        if env_val:
             return f'export {env_name}={path_str}:{env_val}'
-        else:
-            return f'export {env_name}={path_str}'
+        return f'export {env_name}={path_str}'
     
     def unset_env(self, env_name):
         """
@@ -90,6 +90,21 @@ class PackageManager:
         self.scspkg.save()
         return self
 
+    def change_schema_format(self, schema_format):
+        """
+        Change the on-disk schema format of scspkg
+
+        :param schema_format: The new SchemaFormat
+        :return: self
+        """
+        self.scspkg.schema_format = schema_format
+        for pkg_name in self.avail():
+            Package(pkg_name).save()
+            print(f'Package {pkg_name} updated to '
+                  f'{schema_format.name} schema format')
+        self.scspkg.save()
+        return self
+
     def reset_module(self, pkgs):
         """
         This will recreate the modulefiles for a set of pkgs.
@@ -7,9 +7,13 @@ import pathlib
 import inspect
 import os
 from enum import Enum
-# pylint: disable=W0401,W0614
-from jarvis_util import *
-# pylint: enable=W0401,W0614
+import yaml
+
+# Prefer the libyaml-backed loader/dumper when PyYAML was built with it
+# pylint: disable=invalid-name
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+# pylint: enable=invalid-name
 
 
 class ModuleType(Enum):
@@ -17,6 +21,11 @@ class ModuleType(Enum):
     BASH = 'bash'
 
 
+class SchemaFormat(Enum):
+    YAML = 'yaml'
+    JSON = 'json'
+
+
 class ScspkgManager:
     """
     A singleton which stores various properties that can be queried by
@@ -37,6 +46,7 @@ class ScspkgManager:
         self.module_dir = f'{self.scspkg_root}/modulefiles'
         self.config_dir = f'{self.scspkg_root}/config'
         self.module_type = ModuleType.TCL
+        self.schema_format = SchemaFormat.YAML
         self.config = {}
         self.config_path = f'{self.config_dir}/scspkg_config.yaml'
         self.init()
@@ -70,6 +80,9 @@ class ScspkgManager:
 
         :return: self
         """
+        # pylint: disable=C0415
+        from jarvis_util import Rm, LocalExecInfo
+        # pylint: enable=C0415
         Rm(self.pkg_dir, LocalExecInfo())
         Rm(self.module_dir, LocalExecInfo())
         Rm(self.config_dir, LocalExecInfo())
@@ -80,7 +93,9 @@ class ScspkgManager:
         Save the SCSPKG configuration files
         """
         self.config['MODULE_TYPE'] = self.module_type.name
-        YamlFile(self.config_path).save(self.config)
+        self.config['SCHEMA_FORMAT'] = self.schema_format.name
+        with open(self.config_path, 'w', encoding='utf-8') as fp:
+            yaml.dump(self.config, fp, Dumper=YAML_DUMPER)
 
     def load(self):
         """
@@ -88,10 +103,15 @@ class ScspkgManager:
 
         :return: self
         """
-        if os.path.exists(self.config_path):
-            self.config = YamlFile(self.config_path).load()
+        try:
+            with open(self.config_path, 'rb') as fp:
+                self.config = yaml.load(fp, Loader=YAML_LOADER) or {}
+        except FileNotFoundError:
+            pass
         if 'MODULE_TYPE' in self.config:
             self.module_type = ModuleType[self.config['MODULE_TYPE']]
+        if 'SCHEMA_FORMAT' in self.config:
+            self.schema_format = SchemaFormat[self.config['SCHEMA_FORMAT']]
         return self
 
     def build_profile(self, path=None, method=None):
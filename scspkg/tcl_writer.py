@@ -0,0 +1,31 @@
+"""
+This module renders package schemas as TCL modulefiles.
+"""
+import io
+
+
+def render_tcl(sections):
+    """
+    Render the TCL modulefile text of a package schema
+
+    :param sections: The package schema (doc, deps, setenvs, prepends)
+    :return: String
+    """
+    buf = io.StringIO()
+    w = buf.write
+    # The module header
+    w('#%Module1.0\n')
+    # The module doc
+    for doc_key, doc_val in sections['doc'].items():
+        w(f'module-whatis \'{doc_key}: {doc_val}\'\n')
+    # The module dependencies
+    for dep in sections['deps']:
+        w(f'module load {dep}\n')
+    # The module environment variables
+    for env, env_data in sections['setenvs'].items():
+        w(f'setenv {env} {env_data}\n')
+    # The module environment prepends (%-formatting is cheapest for this)
+    fmt = 'prepend-path %s %s\n'.__mod__
+    for env, values in sections['prepends'].items():
+        buf.writelines(fmt((env, env_data)) for env_data in values)
+    return buf.getvalue()
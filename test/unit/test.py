@@ -1,6 +1,8 @@
 from unittest import TestCase
+from unittest.mock import patch
 from scspkg.pkg_manager import PackageManager
-from scspkg.pkg import Package
+from scspkg.pkg import Package, _SCHEMA_CACHE
+from scspkg.scspkg_manager import ScspkgManager, ModuleType, SchemaFormat
 import os
 
 
@@ -21,3 +23,124 @@ class TestScspkg(TestCase):
         self.assertFalse(os.path.exists(pkg.module_path))
         self.assertFalse(os.path.exists(pkg.pkg_root))
         self.assertFalse(os.path.exists(pkg.pkg_src))
+
+    def test_load_legacy_deps(self):
+        pkg = Package('test_legacy_deps').create()
+        with open(pkg.module_schema_path, 'w', encoding='utf-8') as fp:
+            fp.write('deps:\n  a: true\n  b: true\n')
+        self.assertEqual(Package('test_legacy_deps').sections['deps'],
+                         ['a', 'b'])
+
+        with open(pkg.module_schema_path, 'w', encoding='utf-8') as fp:
+            fp.write('')
+        empty = Package('test_legacy_deps')
+        self.assertEqual(empty.sections,
+                         Package('test_legacy_deps').reset_config().sections)
+        empty.add_deps('a').save()
+        self.assertEqual(Package('test_legacy_deps').sections['deps'], ['a'])
+
+        scspkg = ScspkgManager.get_instance()
+        module_type = scspkg.module_type
+        scspkg.module_type = ModuleType.BASH
+        try:
+            with open(pkg.module_schema_path, 'w', encoding='utf-8') as fp:
+                fp.write('')
+            with patch.dict(os.environ):
+                os.environ.pop(pkg.mod_load_name, None)
+                script = Package('test_legacy_deps').module_load()
+            self.assertIn(f'export {pkg.mod_load_name}=1', script)
+        finally:
+            scspkg.module_type = module_type
+        pkg.destroy()
+
+    def test_module_unload_prepends(self):
+        scspkg = ScspkgManager.get_instance()
+        module_type = scspkg.module_type
+        scspkg.module_type = ModuleType.BASH
+        pkg = Package('test_unload')
+        pkg.sections['prepends'] = {'X': ['/x']}
+        cases = [('/a:/x:/b', '/a:/b'),
+                 ('/x:/b', '/b'),
+                 ('/a:/x', '/a'),
+                 ('/x', ''),
+                 ('/y/x:/xz', '/y/x:/xz')]
+        try:
+            for before, after in cases:
+                with patch.dict(os.environ, {pkg.mod_load_name: '1',
+                                             'X': before}):
+                    script = pkg.module_unload()
+                    self.assertEqual(os.environ['X'], after)
+                    self.assertIn(f'export X={after}', script)
+        finally:
+            scspkg.module_type = module_type
+
+    def test_schema_format_migration(self):
+        scspkg = ScspkgManager.get_instance()
+        schema_format = scspkg.schema_format
+        try:
+            scspkg.schema_format = SchemaFormat.YAML
+            pkg = Package('test_schema_format').create()
+            pkg.add_deps('a').set_env('FOO', 'bar').save()
+            yaml_path = pkg.module_schema_path
+            self.assertTrue(yaml_path.endswith('.yaml'))
+
+            scspkg.schema_format = SchemaFormat.JSON
+            pkg = Package('test_schema_format')
+            self.assertEqual(pkg.module_schema_path, yaml_path)
+            sections = pkg.sections
+            pkg.save()
+            json_path = pkg.module_schema_path
+            self.assertTrue(json_path.endswith('.json'))
+            self.assertTrue(os.path.exists(json_path))
+            self.assertFalse(os.path.exists(yaml_path))
+            self.assertNotIn(yaml_path, _SCHEMA_CACHE)
+
+            _SCHEMA_CACHE.clear()
+            pkg = Package('test_schema_format')
+            self.assertEqual(pkg.module_schema_path, json_path)
+            self.assertEqual(pkg.sections, sections)
+            pkg.destroy()
+        finally:
+            scspkg.schema_format = schema_format
+
+    def test_module_load_tracks_sections(self):
+        scspkg = ScspkgManager.get_instance()
+        module_type = scspkg.module_type
+        scspkg.module_type = ModuleType.BASH
+        try:
+            pkg = Package('test_load_cache').create()
+            pkg.set_env('FOO', 'aaa').save()
+            with patch.dict(os.environ):
+                os.environ.pop(pkg.mod_load_name, None)
+                pkg = Package('test_load_cache')
+                self.assertIn('export FOO=aaa', pkg.module_load())
+
+                # The load script changes after save(), even if the
+                # filesystem keeps the old mtime
+                st = os.stat(pkg.module_schema_path)
+                pkg.set_env('FOO', 'bbbbbbbbb').save()
+                os.utime(pkg.module_schema_path,
+                         ns=(st.st_atime_ns, st.st_mtime_ns))
+                self.assertIn('export FOO=bbbbbbbbb', pkg.module_load())
+                self.assertIn('export FOO=bbbbbbbbb',
+                              Package('test_load_cache').module_load())
+
+                # Unsaved edits are reflected, but never leak to other
+                # packages reading the same schema
+                pkg = Package('test_load_cache')
+                pkg.module_load()
+                pkg.set_env('SECRET', 'unsaved')
+                self.assertIn('export SECRET=unsaved', pkg.module_load())
+                pkg.sections['setenvs']['FOO'] = 'changed'
+                self.assertIn('export FOO=changed', pkg.module_load())
+                self.assertNotIn('SECRET',
+                                 Package('test_load_cache').module_load())
+
+                pkg = Package('test_load_cache')
+                pkg.sections['setenvs']['SECRET'] = 'leak'
+                pkg.module_load()
+                self.assertNotIn('SECRET',
+                                 Package('test_load_cache').module_load())
+            pkg.destroy()
+        finally:
+            scspkg.module_type = module_type